@@ -0,0 +1,21 @@
+# Ahead-of-time compile the numeric kernels into a native extension, so the
+# app never JIT-compiles on the request path:
+#
+#   python build_kernels.py
+#
+# This writes burn_kernels.*.so next to this file; forecasting.py picks it up
+# automatically and falls back to Numba's JIT when it is missing.
+import os
+from numba.pycc import CC
+import kernels
+
+cc = CC('burn_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+# One typed export per stock dtype the app stores (int32 / float32, see
+# load_base_data) plus float64; pycc exports are not dtype-checked at call time
+cc.export('burn_stats_i4', 'Tuple((f8, i8))(i4[:])')(kernels.burn_stats)
+cc.export('burn_stats_f4', 'Tuple((f8, i8))(f4[:])')(kernels.burn_stats)
+cc.export('burn_stats_f8', 'Tuple((f8, i8))(f8[:])')(kernels.burn_stats)
+
+if __name__ == '__main__':
+    cc.compile()
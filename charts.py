@@ -0,0 +1,38 @@
+import numpy as np
+
+# Most points a chart series is sent to the browser with
+MAX_CHART_POINTS = 2000
+
+
+# --- LARGEST-TRIANGLE-THREE-BUCKETS DOWNSAMPLING ---
+def lttb_indices(x, y, n_out=MAX_CHART_POINTS):
+    # Keeps the first and last point, plus the point per bucket that forms the
+    # largest triangle with the previous pick and the next bucket's average
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype('int64')
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def lttb_downsample(x, y, n_out=MAX_CHART_POINTS):
+    x, y = np.asarray(x), np.asarray(y)
+    idx = lttb_indices(x, y, n_out)
+    return x[idx], y[idx]
@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+from numba import njit
+from prophet import Prophet
+import kernels
+import os
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Hide Prophet's background logs (also applies inside worker processes)
+logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
+logging.getLogger('prophet').setLevel(logging.ERROR)
+
+
+# --- DATA CLEANING & BURN CALCULATION ---
+def compute_burn(data):
+    data = data.sort_values('Date')
+    # Burn = previous stock minus current stock, restocks (negative burn) clipped to 0.
+    # Diffed in the column's own dtype so large stock levels keep unit precision,
+    # then stored as float32 with the first day (no previous stock) left as NaN.
+    stock = data['Current_Stock'].to_numpy()
+    burn = -np.diff(stock, prepend=stock[:1]).astype(np.float32)
+    burn[:1] = np.nan
+    data['y'] = np.clip(burn, 0, None)
+    return data
+
+
+def to_prophet_frame(data):
+    return data[['Date', 'y']].rename(columns={'Date': 'ds'}).dropna()
+
+
+# --- MODELING ---
+# Series shorter than this use exponential smoothing unless the full models are requested
+SHORT_SERIES_DAYS = 90
+
+
+def ewm_forecast(df_prophet):
+    # 30-day / 7-day exponential moving averages stand in for the seasonal / recent models
+    y = df_prophet['y']
+    f365_val = y.ewm(span=30).mean().iloc[-1] * 30
+    f30_val = y.ewm(span=7).mean().iloc[-1] * 30
+    return f365_val, f30_val
+
+
+def fast_predict(m, future):
+    # Point forecast only: trend plus one matmul per seasonal mode, skipping
+    # Prophet's per-component loop and Monte Carlo uncertainty intervals.
+    df = m.setup_dataframe(future.copy())
+    trend = m.predict_trend(df)
+    seasonal_features, _, component_cols, _ = m.make_all_seasonality_features(df)
+    X = seasonal_features.values
+    beta = m.params['beta'].mean(0)
+    additive = np.matmul(X, beta * component_cols['additive_terms'].values) * m.y_scale
+    multiplicative = np.matmul(X, beta * component_cols['multiplicative_terms'].values)
+    return pd.DataFrame({
+        'ds': df['ds'],
+        'trend': trend,
+        'additive_terms': additive,
+        'multiplicative_terms': multiplicative,
+        'yhat': trend * (1 + multiplicative) + additive,
+    })
+
+
+def fit_models(df_prophet):
+    # The seasonal regression (LAPACK) and the recent Prophet fit (Stan) share
+    # no state and both run outside the GIL, so they are overlapped
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f365_fut = ex.submit(seasonal_forecast, df_prophet)
+        f30_fut = ex.submit(recent_forecast, df_prophet)
+        return f365_fut.result(), f30_fut.result()
+
+
+def recent_forecast(df_prophet):
+    m30 = Prophet(changepoint_prior_scale=0.5, uncertainty_samples=0)
+    # Fit on a compact, freshly indexed 30-row frame rather than a tail view of the full history
+    recent = df_prophet.iloc[-30:].reset_index(drop=True)
+    m30.fit(recent)
+    return fast_predict(m30, m30.make_future_dataframe(periods=30))
+
+
+def warm_up_stan():
+    # Load the bundled Stan executable and run one tiny fit, so its cold start
+    # (backend setup, executable paged in from disk) isn't paid by a real forecast
+    ds = pd.date_range('2000-01-01', periods=10)
+    recent_forecast(pd.DataFrame({'ds': ds, 'y': np.arange(10, dtype=float)}))
+
+
+# --- SEASONAL MODEL: RIDGE REGRESSION ON FOURIER FEATURES ---
+# Linear trend plus yearly seasonality, solved directly with LAPACK instead of
+# Prophet's optimizer. Yearly seasonality only depends on the dates, so Stock
+# IDs observed over the same date range share one design matrix and solve.
+YEARLY_ORDER = 10
+HORIZON_DAYS = 30
+RIDGE_ALPHA = 1.0
+
+
+def fourier_design(t):
+    # Intercept, linear trend and yearly Fourier terms; t is in days
+    cols = [np.ones_like(t), t]
+    for k in range(1, YEARLY_ORDER + 1):
+        w = 2 * np.pi * k * t / 365.25
+        cols += [np.sin(w), np.cos(w)]
+    return np.column_stack(cols)
+
+
+def ridge_solve(X, Y):
+    # Ridge as an augmented least-squares problem; the intercept is not penalized
+    penalty = np.sqrt(RIDGE_ALPHA) * np.eye(X.shape[1])
+    penalty[0, 0] = 0
+    zeros = np.zeros((X.shape[1],) + Y.shape[1:])
+    beta, *_ = np.linalg.lstsq(np.vstack([X, penalty]), np.concatenate([Y, zeros]), rcond=None)
+    return beta
+
+
+def seasonal_forecast(df_prophet):
+    # Fitted history plus the next HORIZON_DAYS days, shaped like a Prophet forecast
+    ds = df_prophet['ds']
+    future_ds = ds.iloc[-1] + pd.to_timedelta(np.arange(1, HORIZON_DAYS + 1), unit='D')
+    all_ds = pd.concat([ds, pd.Series(future_ds)], ignore_index=True)
+    t = ((all_ds - ds.iloc[0]) / pd.Timedelta(days=1)).to_numpy()
+
+    X = fourier_design(t)
+    beta = ridge_solve(X[:len(ds)], df_prophet['y'].to_numpy(dtype=float))
+    return pd.DataFrame({'ds': all_ds, 'yhat': X @ beta})
+
+
+def seasonal_batch(frames):
+    # frames: {sid: df_prophet} -> {sid: 30-day seasonal forecast total}
+    buckets = {}
+    for sid, df_prophet in frames.items():
+        buckets.setdefault(df_prophet['ds'].to_numpy().tobytes(), []).append(sid)
+
+    totals = {}
+    for sids in buckets.values():
+        ds = frames[sids[0]]['ds']
+        t = ((ds - ds.iloc[0]) / pd.Timedelta(days=1)).to_numpy()
+        t_future = t[-1] + np.arange(1, HORIZON_DAYS + 1)
+        Y = np.column_stack([frames[sid]['y'].to_numpy(dtype=float) for sid in sids])
+        beta = ridge_solve(fourier_design(t), Y)
+        totals.update(zip(sids, (fourier_design(t_future) @ beta).sum(axis=0)))
+    return totals
+
+
+# --- RESTOCK DECISION ---
+try:
+    # Ahead-of-time build from build_kernels.py: no LLVM compile on first use
+    import burn_kernels
+    AOT_BURN_STATS = {
+        np.dtype(np.int32): burn_kernels.burn_stats_i4,
+        np.dtype(np.float32): burn_kernels.burn_stats_f4,
+        np.dtype(np.float64): burn_kernels.burn_stats_f8,
+    }
+except ImportError:
+    AOT_BURN_STATS = None
+    jit_burn_stats = njit(cache=True)(kernels.burn_stats)
+
+
+def burn_stats(stock):
+    if AOT_BURN_STATS is None:
+        return jit_burn_stats(stock)
+    # The AOT exports do no dtype checking of their own, so pick the one typed
+    # for this array and only copy to float64 for dtypes without an export
+    kernel = AOT_BURN_STATS.get(stock.dtype)
+    if kernel is None:
+        stock, kernel = stock.astype(np.float64), AOT_BURN_STATS[np.dtype(np.float64)]
+    return kernel(stock)
+
+
+def restock_plan(stock, f365_val, f30_val, current_stock):
+    # Fallback Logic
+    s, k = burn_stats(np.asarray(stock))
+    avg_daily_burn = s / k if k else 0.0
+    fallback = avg_daily_burn * 30
+
+    # Final Calculations
+    f365_final = max(f365_val, fallback)
+    f30_final = max(f30_val, fallback)
+    final_need = max(f365_final, f30_final)
+    order_qty = max(0, final_need - current_stock)
+    return f365_final, f30_final, order_qty, avg_daily_burn
+
+
+# --- BATCH FORECAST (one Stock ID per worker process) ---
+def fit_one(sid, data, df_prophet, f365_val, use_full_models=True):
+    if not use_full_models and len(df_prophet) < SHORT_SERIES_DAYS:
+        f365_val, f30_val = ewm_forecast(df_prophet)
+    else:
+        f30_val = recent_forecast(df_prophet)['yhat'].tail(30).sum()
+
+    current_stock = data['Current_Stock'].iloc[-1]
+    stock = data['Current_Stock'].to_numpy()
+    f365_final, f30_final, order_qty, _ = restock_plan(stock, f365_val, f30_val, current_stock)
+    return sid, f365_final, f30_final, order_qty
+
+
+def batch_forecast(groups, use_full_models=True):
+    # Results keep the order of groups; Stock IDs without enough data get a
+    # None placeholder in their own position
+    results = []
+    fit_pos, sids, datas, frames = [], [], [], []
+    for group_df in groups:
+        sid = group_df['StockID'].iloc[0]
+        data = compute_burn(group_df.copy())
+        df_prophet = to_prophet_frame(data)
+        results.append((sid, None, None, None))
+        if len(df_prophet) < 2:
+            continue
+        fit_pos.append(len(results) - 1)
+        sids.append(sid)
+        datas.append(data)
+        frames.append(df_prophet)
+
+    # Seasonal forecasts for every Stock ID in a few shared solves, then the
+    # per-Stock ID recent-anomaly models across processes
+    seasonal = seasonal_batch(dict(zip(sids, frames)))
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        fitted = executor.map(
+            partial(fit_one, use_full_models=use_full_models), sids, datas, frames, [seasonal[sid] for sid in sids]
+        )
+        for pos, result in zip(fit_pos, fitted):
+            results[pos] = result
+    return results
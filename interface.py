@@ -1,21 +1,40 @@
 import streamlit as st  # This MUST be line 1
+import numpy as np
 import pandas as pd
-from prophet import Prophet
-from prophet.plot import plot_plotly
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import plotly.graph_objects as go
-import ssl
-import logging
+import altair as alt
+import io
+import certifi
+import requests
+import hashlib
+from forecasting import (
+    SHORT_SERIES_DAYS, compute_burn, to_prophet_frame, ewm_forecast, fit_models, restock_plan, batch_forecast,
+    warm_up_stan
+)
+from charts import lttb_downsample
 
 # 1. Page Configuration
 st.set_page_config(page_title="Team Synergy | Restock AI", layout="wide")
 
-# Hide Prophet's background logs
-logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
-logging.getLogger('prophet').setLevel(logging.ERROR)
-
 st.title("📦 Predictive Restock Assistant")
 st.markdown("---")
 
+# Pay Prophet's Stan start-up once per server process, not on the first click.
+# A failure is cached too: the smoothing and ridge paths don't need Stan, and
+# the Prophet path reports its own error when a forecast is run.
+@st.cache_resource
+def stan_ready():
+    try:
+        warm_up_stan()
+        return True
+    except Exception:
+        return False
+
+if not stan_ready():
+    st.sidebar.warning("Prophet's Stan backend failed to start. Recent-anomaly forecasts may not be available.")
+
 # 2. Sidebar Configuration
 st.sidebar.header("Data Control Center")
 url = st.sidebar.text_input(
@@ -24,69 +43,126 @@ url = st.sidebar.text_input(
 )
 
 # --- LOAD DATA FIRST TO POPULATE FILTER ---
-@st.cache_data
+# One pooled, gzip-accepting HTTP session, verified against certifi's CA bundle
+@st.cache_resource
+def http_session():
+    s = requests.Session()
+    s.headers.update({'Accept-Encoding': 'gzip'})
+    s.verify = certifi.where()
+    return s
+
+# Refetch the sheet at most every 10 minutes; parse from memory, not the socket,
+# with Arrow's multi-threaded CSV reader
+@st.cache_data(ttl=600)
 def load_base_data(url):
-    ssl._create_default_https_context = ssl._create_unverified_context
-    df = pd.read_csv(url)
-    df['Date'] = pd.to_datetime(df['Date'])
+    r = http_session().get(url, timeout=10)
+    r.raise_for_status()
+    try:
+        # ISO dates (including date-only values) parse straight to datetime64 in Arrow
+        date_types = pacsv.ConvertOptions(column_types={'Date': pa.timestamp('ns')})
+        df = pacsv.read_csv(io.BytesIO(r.content), convert_options=date_types).to_pandas()
+    except pa.ArrowInvalid:
+        # Non-ISO sheet date formats are left to pandas
+        df = pacsv.read_csv(io.BytesIO(r.content)).to_pandas()
+        df['Date'] = pd.to_datetime(df['Date'])
+    df['StockID'] = df['StockID'].astype('category')
+
+    # 32-bit stock levels halve the bytes every later pass touches
+    stock = df['Current_Stock']
+    if pd.api.types.is_integer_dtype(stock) and stock.abs().max() <= np.iinfo(np.int32).max:
+        df['Current_Stock'] = stock.astype(np.int32)
+    else:
+        df['Current_Stock'] = stock.astype(np.float32)
     return df
 
+# Split the sheet into per-Stock ID histories once, instead of masking the
+# full frame on every rerun. cache_resource hands back the dict itself
+# rather than unpickling a copy of every group each time. Expires with the
+# sheet itself so old sheet versions aren't kept for the server's lifetime.
+@st.cache_resource(ttl=600, max_entries=4)
+def stock_groups(df):
+    return {sid: g.sort_values('Date').reset_index(drop=True) for sid, g in df.groupby('StockID', observed=True)}
+
+# Selector options and Stock ID -> Item Name lookup, built once per sheet
+@st.cache_data(ttl=600, max_entries=4)
+def stock_catalog(df):
+    return sorted(df['StockID'].unique().tolist()), dict(df.groupby('StockID', observed=True)['Item Name'].first())
+
+# --- CACHED MODEL FITTING ---
+# Keyed on the Stock ID plus a hash of its burn history, so reruns (tab switches,
+# repeat clicks) reuse the forecasts instead of refitting the models.
+@st.cache_data(max_entries=64)
+def fit_and_forecast(_df_prophet, data_hash, stock_id):
+    return fit_models(_df_prophet)
+
+# --- HISTORY CHARTS ---
+# LTTB-downsampled and cached, so reruns don't re-serialize every row of history.
+# Bounded like the sheet caches so old sheet versions are evicted.
+@st.cache_data(ttl=600, max_entries=64)
+def history_chart(ds, values, title, mark='line'):
+    xs, ys = lttb_downsample(ds, values)
+    chart = alt.Chart(pd.DataFrame({'Date': xs, 'value': ys}))
+    chart = chart.mark_area() if mark == 'area' else chart.mark_line()
+    return chart.encode(x='Date:T', y=alt.Y('value:Q', title=title))
+
+def hash_frame(df):
+    return hashlib.md5(pd.util.hash_pandas_object(df, index=False).values).hexdigest()
+
 try:
     raw_data = load_base_data(url)
 
     # Stock ID Selector
-    unique_stocks = sorted(raw_data['StockID'].unique())
+    unique_stocks, name_map = stock_catalog(raw_data)
     selected_stock = st.sidebar.selectbox("Select Stock ID to Analyze", unique_stocks)
 
     # Filter data for the specific Stock ID
-    data = raw_data[raw_data['StockID'] == selected_stock].copy()
-    item_name = data['Item Name'].iloc[0] if not data.empty else "Unknown"
+    data = stock_groups(raw_data)[selected_stock].copy()
+    item_name = name_map.get(selected_stock, "Unknown")
 
     st.sidebar.write(f"**Item Name:** {item_name}")
 
+    # Short histories use a fast smoothing forecast unless the full models are forced
+    use_full_models = st.sidebar.toggle(
+        "Use full models for short histories (slower)", value=False,
+        help=f"Stock IDs with fewer than {SHORT_SERIES_DAYS} days of history otherwise use exponential smoothing instead of the seasonal and recent-anomaly models."
+    )
+
 except Exception as e:
     st.sidebar.error(f"Could not connect to Google Sheet.")
     st.stop()
 
 # 3. Main Execution Logic
-if st.sidebar.button("Run Intelligence Engine"):
+run_one = st.sidebar.button("Run Intelligence Engine")
+run_all = st.sidebar.button("Fit All Stock IDs")
+
+if run_one:
     with st.spinner(f'Calculating Seasonal Trends for {item_name}...'):
         try:
             # --- DATA CLEANING & BURN CALCULATION ---
-            data = data.sort_values('Date')
-            data['y'] = data['Current_Stock'].shift(1) - data['Current_Stock']
-            data.loc[data['y'] < 0, 'y'] = 0
-
-            df_prophet = data[['Date', 'y']].rename(columns={'Date': 'ds'}).dropna()
+            data = compute_burn(data)
+            df_prophet = to_prophet_frame(data)
 
             if len(df_prophet) < 2:
                 st.warning("Not enough data to generate a forecast.")
             else:
-                # 4. Modeling
-                m365 = Prophet(yearly_seasonality=True, daily_seasonality=False)
-                m365.fit(df_prophet)
-
-                m30 = Prophet(changepoint_prior_scale=0.5)
-                m30.fit(df_prophet.tail(30))
-
-                # 5. Predictions
-                future = m365.make_future_dataframe(periods=30)
-                forecast_res_365 = m365.predict(future)
-
-                f365_val = forecast_res_365['yhat'].tail(30).sum()
-                f30_val = m30.predict(future)['yhat'].tail(30).sum()
-
-                # Fallback Logic
-                avg_daily_burn = df_prophet['y'].mean()
-                fallback = avg_daily_burn * 30
-
-                # Final Calculations
-                f365_final = max(f365_val, fallback)
-                f30_final = max(f30_val, fallback)
-                final_need = max(f365_final, f30_final)
-
+                # 4. Modeling & 5. Predictions
+                if not use_full_models and len(df_prophet) < SHORT_SERIES_DAYS:
+                    forecast_res_365 = None
+                    f365_val, f30_val = ewm_forecast(df_prophet)
+                else:
+                    # Cached per Stock ID + data
+                    forecast_res_365, forecast_res_30 = fit_and_forecast(
+                        df_prophet, hash_frame(df_prophet), selected_stock
+                    )
+
+                    f365_val = forecast_res_365['yhat'].tail(30).sum()
+                    f30_val = forecast_res_30['yhat'].tail(30).sum()
+
+                # Fallback Logic & Final Calculations
                 current_stock = data['Current_Stock'].iloc[-1]
-                order_qty = max(0, final_need - current_stock)
+                f365_final, f30_final, order_qty, avg_daily_burn = restock_plan(
+                    data['Current_Stock'].to_numpy(), f365_val, f30_val, current_stock
+                )
 
                 # Logic explanation
                 winning_model = "Seasonal Baseline" if f365_final > f30_final else "Recent Anomaly Detection"
@@ -109,21 +185,56 @@ if st.sidebar.button("Run Intelligence Engine"):
 
                 # --- 8. VISUALIZATIONS ---
                 st.markdown("---")
-                tab1, tab2 = st.tabs(["📈 Inventory History", "🤖 Prophet AI Model"])
+                tab1, tab2 = st.tabs(["📈 Inventory History", "🤖 Seasonal AI Model"])
 
                 with tab1:
                     c1, c2 = st.columns(2)
                     with c1:
                         st.subheader("Historical Stock Levels")
-                        st.line_chart(data.set_index('Date')['Current_Stock'])
+                        st.altair_chart(
+                            history_chart(data['Date'], data['Current_Stock'], 'Current_Stock'),
+                            use_container_width=True
+                        )
                     with c2:
                         st.subheader("Daily Usage Pattern")
-                        st.area_chart(data.set_index('Date')['y'])
+                        st.altair_chart(
+                            history_chart(df_prophet['ds'], df_prophet['y'], 'y', mark='area'),
+                            use_container_width=True
+                        )
 
                 with tab2:
                     st.subheader("Interactive Seasonal Projection")
-                    fig = plot_plotly(m365, forecast_res_365)
-                    st.plotly_chart(fig, use_container_width=True)
+                    if forecast_res_365 is None:
+                        st.info(f"Less than {SHORT_SERIES_DAYS} days of history, so exponential smoothing was used instead of the seasonal model. Enable 'Use full models for short histories' to see the seasonal projection.")
+                    else:
+                        # WebGL traces on LTTB-downsampled series keep the payload small for long histories
+                        actual_x, actual_y = lttb_downsample(df_prophet['ds'], df_prophet['y'])
+                        pred_x, pred_y = lttb_downsample(forecast_res_365['ds'], forecast_res_365['yhat'])
+                        fig = go.Figure()
+                        fig.add_trace(go.Scattergl(
+                            x=actual_x, y=actual_y, mode='markers', name='Actual',
+                            marker=dict(color='black', size=4)
+                        ))
+                        fig.add_trace(go.Scattergl(
+                            x=pred_x, y=pred_y, mode='lines', name='Predicted',
+                            line=dict(color='#0072B2')
+                        ))
+                        fig.update_layout(xaxis_title='Date', yaxis_title='Daily Usage')
+                        st.plotly_chart(fig, use_container_width=True)
+
+        except Exception as e:
+            st.error(f"Prediction Error: {e}")
+
+elif run_all:
+    with st.spinner(f'Forecasting {len(unique_stocks)} Stock IDs in parallel...'):
+        try:
+            results = batch_forecast(stock_groups(raw_data).values(), use_full_models=use_full_models)
+
+            st.header("Restock Intelligence: All Stock IDs")
+            summary = pd.DataFrame(
+                results, columns=['StockID', 'Seasonal Forecast (30d)', 'Anomaly Forecast (30d)', 'Recommended Order']
+            )
+            st.dataframe(summary, use_container_width=True)
 
         except Exception as e:
             st.error(f"Prediction Error: {e}")
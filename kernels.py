@@ -0,0 +1,17 @@
+# Numeric kernels shared by the JIT path (forecasting.py) and the
+# ahead-of-time build (build_kernels.py). Plain Python so both can compile them.
+
+
+def burn_stats(stock):
+    # Single pass over the stock levels: total positive burn and number of
+    # valid (non-NaN) day-over-day changes, no temporary arrays
+    s = 0.0
+    k = 0
+    for i in range(1, stock.size):
+        d = stock[i - 1] - stock[i]
+        if d != d:
+            continue
+        k += 1
+        if d > 0:
+            s += d
+    return s, k